@@ -7,16 +7,23 @@ Users authenticate through Reddit's OAuth2 flow without exposing credentials. wo
 """
 
 import os
+import asyncio
+import heapq
 import secrets
+import time
+import json
 import httpx
-from fastapi import FastAPI, HTTPException, Request, Response, Depends
+import redis.asyncio as redis
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 import logging
 from datetime import datetime, timedelta
 import base64
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -26,10 +33,47 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+USER_AGENT = "RedditOAuth2App/1.0"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up the pooled Reddit HTTP client, per-loop concurrency limits and the session reaper"""
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        timeout=10.0,
+        headers={"User-Agent": USER_AGENT}
+    )
+    # Concurrency primitives are created here so they belong to this event loop
+    app.state.listing_semaphore = asyncio.Semaphore(LISTING_CONCURRENCY)
+    app.state.reddit_limiter = RateLimiter(
+        rate=REDDIT_REQUESTS_PER_MINUTE / WEB_CONCURRENCY / 60,
+        capacity=max(1, REDDIT_REQUESTS_PER_MINUTE // WEB_CONCURRENCY)
+    )
+    # Redis expires sessions itself; the in-memory store needs a reaper.
+    # The wake-up event is created here so it belongs to this event loop
+    app.state.session_expiry_added = asyncio.Event()
+    reaper = None
+    if redis_client is None:
+        reaper = asyncio.create_task(reap_expired_sessions(app.state.session_expiry_added))
+        reaper.add_done_callback(log_reaper_exit)
+    try:
+        yield
+    finally:
+        if reaper is not None:
+            reaper.cancel()
+            with suppress(asyncio.CancelledError):
+                await reaper
+        await app.state.http.aclose()
+        if redis_client is not None:
+            await redis_client.aclose()
+
 app = FastAPI(
     title="Reddit OAuth2 API",
     description="Secure Reddit API using OAuth2 Authorization Code Flow",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Environment variables
@@ -38,6 +82,8 @@ REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_REDIRECT_URI = os.getenv("REDDIT_REDIRECT_URI")  # Should be your backend /callback URL
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+REDIS_URL = os.getenv("REDIS_URL")  # Enables the shared Redis session store
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))  # Number of uvicorn worker processes
 
 # Validate required environment variables
 required_vars = ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_REDIRECT_URI"]
@@ -45,6 +91,11 @@ missing_vars = [var for var in required_vars if not os.getenv(var)]
 if missing_vars:
     raise ValueError(f"Missing required environment variables: {missing_vars}")
 
+# Basic auth header for the token endpoint, built once from the app credentials
+REDDIT_BASIC_AUTH = "Basic " + base64.b64encode(
+    f"{REDDIT_CLIENT_ID}:{REDDIT_CLIENT_SECRET}".encode('utf-8')
+).decode('utf-8')
+
 # CORS configuration
 origins = [
     "http://localhost:3000",
@@ -60,14 +111,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory session store (use Redis in production)
+# Session store: Redis when REDIS_URL is set (required for multiple workers),
+# otherwise an in-memory dict local to this process
+redis_client = redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
 sessions: Dict[str, Dict[str, Any]] = {}
 
+# Expiry heap for the in-memory store, drained by reap_expired_sessions
+session_expirations: List[Tuple[datetime, str]] = []
+
+# OAuth2 state parameters only need to survive the trip through Reddit's consent page
+OAUTH_STATE_TTL = 600
+
 # Reddit API endpoints
 REDDIT_AUTHORIZE_URL = "https://www.reddit.com/api/v1/authorize"
 REDDIT_TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
 REDDIT_API_BASE = "https://oauth.reddit.com"
 
+# Reddit listings never return more than ~1000 items, however far they are paged
+REDDIT_LISTING_CAP = 1000
+
+# Bound concurrent listing page fetches to stay within Reddit's rate limit
+LISTING_CONCURRENCY = 5
+
+# Retry policy for rate-limited (429) Reddit responses; also the longest a request
+# waits for the client-side rate limiter
+REDDIT_MAX_RETRIES = 3
+REDDIT_MAX_RETRY_DELAY = 10.0
+
+class RateLimiter:
+    """Async token bucket that shapes outgoing requests to a steady rate"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self, max_wait: float) -> None:
+        """Wait until a token is available and take it, raising TimeoutError after max_wait seconds"""
+        async with asyncio.timeout(max_wait), self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Reddit allows 100 requests per minute per OAuth client; the limiter created in
+# lifespan refills at that rate and allows a minute's worth of burst. Each worker
+# process has its own limiter, so the budget is split across WEB_CONCURRENCY
+REDDIT_REQUESTS_PER_MINUTE = 100
+
 # Pydantic models
 class UserProfile(BaseModel):
     username: str
@@ -102,6 +199,130 @@ class AuthResponse(BaseModel):
     auth_url: str
     state: str
 
+# Computed profiles cached per session so repeat views skip the full listing walk
+# (kept in Redis under prof:<id> when REDIS_URL is set)
+PROFILE_CACHE_TTL = timedelta(minutes=5)
+profile_cache: Dict[str, Tuple[datetime, UserProfile]] = {}
+
+# One lock per session so concurrent profile requests share a single fetch,
+# with a count of the requests using it so it can be dropped afterwards
+profile_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+async def save_session(key: str, data: Dict[str, Any], ttl: int) -> None:
+    """Store session data that expires after ttl seconds"""
+    if redis_client is not None:
+        await redis_client.set(f"sess:{key}", json.dumps(data), ex=ttl)
+    else:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        sessions[key] = {**data, "expires_at": expires_at}
+        heapq.heappush(session_expirations, (expires_at, key))
+        # Wake the reaper, if it is running, in case this session expires soonest
+        expiry_added = getattr(app.state, "session_expiry_added", None)
+        if expiry_added is not None:
+            expiry_added.set()
+
+async def load_session(key: str) -> Optional[Dict[str, Any]]:
+    """Load session data, or None if it does not exist or has expired"""
+    if redis_client is not None:
+        raw = await redis_client.get(f"sess:{key}")
+        return json.loads(raw) if raw else None
+    
+    # The reaper frees expired sessions; this check still applies if it isn't running
+    session = sessions.get(key)
+    if session and datetime.utcnow() > session["expires_at"]:
+        return None
+    return session
+
+async def pop_session(key: str) -> Optional[Dict[str, Any]]:
+    """Atomically remove and return session data (used for one-time OAuth2 states)"""
+    if redis_client is not None:
+        raw = await redis_client.getdel(f"sess:{key}")
+        return json.loads(raw) if raw else None
+    
+    session = sessions.pop(key, None)
+    if session and datetime.utcnow() > session["expires_at"]:
+        return None
+    return session
+
+async def delete_session(key: str) -> None:
+    """Delete session data and anything cached for it"""
+    if redis_client is not None:
+        await redis_client.delete(f"sess:{key}", f"prof:{key}")
+    else:
+        sessions.pop(key, None)
+        profile_cache.pop(key, None)
+
+async def reap_expired_sessions(session_expiry_added: asyncio.Event) -> None:
+    """Evict in-memory sessions as they expire, sleeping until the next expiry"""
+    while True:
+        session_expiry_added.clear()
+        timeout = None
+        
+        if session_expirations:
+            expires_at, key = session_expirations[0]
+            timeout = (expires_at - datetime.utcnow()).total_seconds()
+            if timeout <= 0:
+                heapq.heappop(session_expirations)
+                # Skip entries for sessions that were deleted or replaced since
+                session = sessions.get(key)
+                if session and session["expires_at"] == expires_at:
+                    await delete_session(key)
+                continue
+        
+        # Wake early if a session is added that may expire sooner
+        try:
+            await asyncio.wait_for(session_expiry_added.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def log_reaper_exit(task: asyncio.Task) -> None:
+    """Log the session reaper stopping with an error instead of failing silently"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Session reaper stopped", exc_info=task.exception())
+
+async def get_cached_profile(session_id: str) -> Optional[UserProfile]:
+    """Return the session's cached profile if it is still fresh"""
+    if redis_client is not None:
+        raw = await redis_client.get(f"prof:{session_id}")
+        return UserProfile.model_validate_json(raw) if raw else None
+    
+    cached = profile_cache.get(session_id)
+    if cached and datetime.utcnow() - cached[0] < PROFILE_CACHE_TTL:
+        return cached[1]
+    return None
+
+async def cache_profile(session_id: str, profile: UserProfile) -> None:
+    """Cache a computed profile for PROFILE_CACHE_TTL"""
+    if redis_client is not None:
+        await redis_client.set(
+            f"prof:{session_id}",
+            profile.model_dump_json(),
+            ex=int(PROFILE_CACHE_TTL.total_seconds())
+        )
+        return
+    
+    # Prune stale entries so profiles of expired sessions don't accumulate
+    now = datetime.utcnow()
+    for key in [key for key, (cached_at, _) in profile_cache.items() if now - cached_at >= PROFILE_CACHE_TTL]:
+        del profile_cache[key]
+    profile_cache[session_id] = (now, profile)
+
+@asynccontextmanager
+async def profile_lock(session_id: str):
+    """Hold the session's profile lock, removing it once no request is using it"""
+    lock, users = profile_locks.get(session_id, (None, 0))
+    lock = lock or asyncio.Lock()
+    profile_locks[session_id] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = profile_locks[session_id]
+        if users == 1:
+            del profile_locks[session_id]
+        else:
+            profile_locks[session_id] = (lock, users - 1)
+
 def generate_state() -> str:
     """Generate a secure random state parameter for OAuth2"""
     return secrets.token_urlsafe(32)
@@ -120,19 +341,12 @@ def create_auth_url(state: str) -> str:
         "scope": scope
     }
     
-    query_string = "&".join([f"{k}={v}" for k, v in params.items()])
-    return f"{REDDIT_AUTHORIZE_URL}?{query_string}"
+    return f"{REDDIT_AUTHORIZE_URL}?{urlencode(params)}"
 
-async def exchange_code_for_token(code: str) -> Dict[str, Any]:
+async def exchange_code_for_token(client: httpx.AsyncClient, code: str) -> Dict[str, Any]:
     """Exchange authorization code for access token"""
-    # Create basic auth header
-    auth_string = f"{REDDIT_CLIENT_ID}:{REDDIT_CLIENT_SECRET}"
-    auth_bytes = auth_string.encode('utf-8')
-    auth_b64 = base64.b64encode(auth_bytes).decode('utf-8')
-    
     headers = {
-        "Authorization": f"Basic {auth_b64}",
-        "User-Agent": "RedditOAuth2App/1.0"
+        "Authorization": REDDIT_BASIC_AUTH
     }
     
     data = {
@@ -141,68 +355,124 @@ async def exchange_code_for_token(code: str) -> Dict[str, Any]:
         "redirect_uri": REDDIT_REDIRECT_URI
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            REDDIT_TOKEN_URL,
-            headers=headers,
-            data=data
-        )
-        
-        if response.status_code != 200:
-            logger.error(f"Token exchange failed: {response.status_code} {response.text}")
-            raise HTTPException(status_code=400, detail="Failed to exchange code for token")
-        
-        return response.json()
+    response = await client.post(
+        REDDIT_TOKEN_URL,
+        headers=headers,
+        data=data
+    )
+    
+    if response.status_code != 200:
+        logger.error(f"Token exchange failed: {response.status_code} {response.text}")
+        raise HTTPException(status_code=400, detail="Failed to exchange code for token")
+    
+    return response.json()
 
-async def get_total_count(access_token: str, endpoint: str) -> int:
-    """Get total count of posts or comments by fetching all pages"""
-    total_count = 0
+async def iter_listing_pages(client: httpx.AsyncClient, access_token: str, endpoint: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield each page of a Reddit listing's children; page fetch errors propagate to the caller"""
     after = None
     limit = 100
     
+    # Listings only paginate through the "after" cursor, so pages are walked
+    # in order; the semaphore keeps concurrent walks from bursting past the limit
     while True:
         # Build URL with pagination parameters
         url = f"{endpoint}?limit={limit}"
         if after:
             url += f"&after={after}"
             
-        try:
-            data = await make_reddit_api_request(access_token, url)
-            children = data["data"].get("children", [])
-            
-            if not children:
-                break
-                
-            # Count items in this batch
-            for item in children:
-                total_count += 1
-            
-            # Get pagination token for next batch
-            after = data["data"].get("after")
-            if not after:
+        async with app.state.listing_semaphore:
+            data = await make_reddit_api_request(client, access_token, url)
+        
+        children = data["data"].get("children", [])
+        if not children:
+            return
+        
+        yield children
+        
+        # Get pagination token for next batch
+        after = data["data"].get("after")
+        if not after:
+            return
+
+async def get_total_count(client: httpx.AsyncClient, access_token: str, endpoint: str) -> Tuple[int, bool]:
+    """Count posts or comments (capped at Reddit's 1000-item listing limit) and whether the walk completed"""
+    total_count = 0
+    
+    try:
+        async for children in iter_listing_pages(client, access_token, endpoint):
+            total_count += len(children)
+            if total_count >= REDDIT_LISTING_CAP:
                 break
-                
-        except Exception as e:
-            logger.error(f"Error fetching page from {endpoint}: {str(e)}")
-            break
+    except Exception as e:
+        logger.error(f"Error fetching page from {endpoint}: {str(e)}")
+        return total_count, False
             
-    return total_count
+    return total_count, True
 
-async def make_reddit_api_request(access_token: str, endpoint: str) -> Dict[str, Any]:
+async def make_reddit_api_request(client: httpx.AsyncClient, access_token: str, endpoint: str) -> Dict[str, Any]:
     """Make authenticated request to Reddit API"""
     headers = {
-        "Authorization": f"Bearer {access_token}",
-        "User-Agent": "RedditOAuth2App/1.0"
+        "Authorization": f"Bearer {access_token}"
     }
     
-    async with httpx.AsyncClient() as client:
+    for attempt in range(REDDIT_MAX_RETRIES + 1):
+        try:
+            await app.state.reddit_limiter.acquire(REDDIT_MAX_RETRY_DELAY)
+        except TimeoutError:
+            logger.error("Reddit rate limit budget exhausted, not waiting any longer")
+            raise HTTPException(status_code=429, detail="Reddit rate limit reached, try again later")
         response = await client.get(f"{REDDIT_API_BASE}{endpoint}", headers=headers)
         
-        if response.status_code != 200:
-            logger.error(f"Reddit API request failed: {response.status_code} {response.text}")
-            raise HTTPException(status_code=400, detail="Failed to fetch data from Reddit")
+        if response.status_code != 429 or attempt == REDDIT_MAX_RETRIES:
+            break
         
-        return response.json()
+        # Back off exponentially, or until Reddit says the rate window resets
+        try:
+            delay = float(response.headers.get("X-Ratelimit-Reset", 2 ** attempt))
+        except ValueError:
+            delay = 2 ** attempt
+        if delay > REDDIT_MAX_RETRY_DELAY:
+            break
+        logger.warning(f"Reddit rate limit hit, retrying in {delay}s")
+        await asyncio.sleep(delay)
+    
+    if response.status_code != 200:
+        logger.error(f"Reddit API request failed: {response.status_code} {response.text}")
+        raise HTTPException(status_code=400, detail="Failed to fetch data from Reddit")
+    
+    return response.json()
+
+def build_post(post: Dict[str, Any]) -> Post:
+    """Build a Post from a submission in a Reddit listing"""
+    created_utc = post.get("created_utc", 0)
+    created_time = datetime.fromtimestamp(created_utc).isoformat(sep=' ', timespec='seconds') if created_utc else "Unknown"
+    
+    return Post(
+        title=post.get("title", ""),
+        subreddit=post.get("subreddit", ""),
+        score=post.get("score", 0),
+        num_comments=post.get("num_comments", 0),
+        created_utc=created_utc,
+        created_time=created_time,
+        permalink=f"https://reddit.com{post.get('permalink', '')}",
+        url=post.get("url", ""),
+        selftext=post.get("selftext", None) if post.get("selftext") else None
+    )
+
+def build_comment(comment: Dict[str, Any]) -> Comment:
+    """Build a Comment from a comment in a Reddit listing"""
+    created_utc = comment.get("created_utc", 0)
+    created_time = datetime.fromtimestamp(created_utc).isoformat(sep=' ', timespec='seconds') if created_utc else "Unknown"
+    
+    return Comment(
+        subreddit=comment.get("subreddit", ""),
+        post_title=comment.get("link_title", "Unknown Post"),
+        score=comment.get("score", 0),
+        created_utc=created_utc,
+        created_time=created_time,
+        body=comment.get("body", ""),
+        permalink=f"https://reddit.com{comment.get('permalink', '')}"
+    )
 
 @app.get("/")
 async def root():
@@ -225,16 +495,13 @@ async def login():
     state = generate_state()
     auth_url = create_auth_url(state)
     
-    # Store state for validation (in production, use Redis with expiration)
-    sessions[state] = {
-        "created_at": datetime.utcnow(),
-        "used": False
-    }
+    # Store state for validation
+    await save_session(state, {"created_at": datetime.utcnow().isoformat()}, OAUTH_STATE_TTL)
     
     return AuthResponse(auth_url=auth_url, state=state)
 
 @app.get("/auth/callback")
-async def auth_callback(code: str, state: str, error: Optional[str] = None):
+async def auth_callback(request: Request, code: str, state: str, error: Optional[str] = None):
     """OAuth2 callback endpoint - Reddit redirects here after user authorization"""
     
     if error:
@@ -244,31 +511,28 @@ async def auth_callback(code: str, state: str, error: Optional[str] = None):
             status_code=302
         )
     
-    # Validate state parameter
-    if state not in sessions or sessions[state]["used"]:
+    # Validate state parameter (popping it ensures it can only be used once)
+    if await pop_session(state) is None:
         logger.error(f"Invalid or used state: {state}")
         return RedirectResponse(
             url=f"{FRONTEND_URL}/?error=invalid_state",
             status_code=302
         )
     
-    # Mark state as used
-    sessions[state]["used"] = True
-    
     try:
         # Exchange code for access token
-        token_data = await exchange_code_for_token(code)
+        token_data = await exchange_code_for_token(request.app.state.http, code)
         access_token = token_data["access_token"]
         
         # Generate session ID
         session_id = secrets.token_urlsafe(32)
         
-        # Store session (in production, use Redis with expiration)
-        sessions[session_id] = {
-            "access_token": access_token,
-            "created_at": datetime.utcnow(),
-            "expires_at": datetime.utcnow() + timedelta(seconds=token_data.get("expires_in", 3600))
-        }
+        # Store session for as long as the access token is valid
+        await save_session(
+            session_id,
+            {"access_token": access_token, "created_at": datetime.utcnow().isoformat()},
+            token_data.get("expires_in", 3600)
+        )
         
         # Redirect to frontend with session ID
         return RedirectResponse(
@@ -283,123 +547,110 @@ async def auth_callback(code: str, state: str, error: Optional[str] = None):
             status_code=302
         )
 
-def get_session(session_id: str) -> Dict[str, Any]:
+async def get_session(session_id: str) -> Dict[str, Any]:
     """Get and validate session"""
-    if not session_id or session_id not in sessions:
-        raise HTTPException(status_code=401, detail="Invalid session")
-    
-    session = sessions[session_id]
+    session = await load_session(session_id) if session_id else None
     
-    # Check if session is expired
-    if datetime.utcnow() > session.get("expires_at", datetime.utcnow()):
-        del sessions[session_id]
-        raise HTTPException(status_code=401, detail="Session expired")
+    # Expired sessions are gone from the store; OAuth2 states have no token
+    if not session or "access_token" not in session:
+        raise HTTPException(status_code=401, detail="Invalid session")
     
     return session
 
 @app.get("/api/profile", response_model=UserProfile)
-async def get_user_profile(session_id: str):
+async def get_user_profile(request: Request, session_id: str):
     """Get user profile information"""
-    session = get_session(session_id)
+    session = await get_session(session_id)
     access_token = session["access_token"]
+    client = request.app.state.http
     
-    try:
-        # Get user identity
-        me_data = await make_reddit_api_request(access_token, "/api/v1/me")
-        logger.info(f"Fetching stats for user: {me_data.get('name', 'Unknown')}")
-        
-        # Get user posts count (get all posts to count them properly)
-        logger.info("Starting posts count...")
-        posts_count = await get_total_count(access_token, "/user/self/submitted")
-        logger.info(f"Total posts found: {posts_count}")
-        
-        # Get user comments count (get all comments to count them properly)
-        logger.info("Starting comments count...")
-        comments_count = await get_total_count(access_token, "/user/self/comments")
-        logger.info(f"Total comments found: {comments_count}")
-        
-        created_utc = me_data.get("created_utc", 0)
-        created_date = datetime.fromtimestamp(created_utc).strftime('%Y-%m-%d') if created_utc else "Unknown"
-        
-        logger.info(f"Profile complete - Posts: {posts_count}, Comments: {comments_count}")
+    profile = await get_cached_profile(session_id)
+    if profile:
+        return profile
+    
+    # Concurrent requests for the same session wait here and reuse the first result
+    async with profile_lock(session_id):
+        profile = await get_cached_profile(session_id)
+        if profile:
+            return profile
         
-        return UserProfile(
-            username=me_data.get("name", "Unknown"),
-            total_karma=me_data.get("total_karma", 0),
-            link_karma=me_data.get("link_karma", 0),
-            comment_karma=me_data.get("comment_karma", 0),
-            account_created=created_date,
-            total_posts=posts_count,
-            total_comments=comments_count
-        )
+        try:
+            # Fetch user identity, posts count and comments count concurrently;
+            # the task group cancels the remaining fetches if one of them fails
+            logger.info("Starting identity, posts and comments fetch...")
+            async with asyncio.TaskGroup() as tg:
+                me_task = tg.create_task(make_reddit_api_request(client, access_token, "/api/v1/me"))
+                posts_task = tg.create_task(get_total_count(client, access_token, "/user/self/submitted"))
+                comments_task = tg.create_task(get_total_count(client, access_token, "/user/self/comments"))
+            me_data = me_task.result()
+            posts_count, posts_complete = posts_task.result()
+            comments_count, comments_complete = comments_task.result()
+            logger.info(f"Fetched stats for user: {me_data.get('name', 'Unknown')}")
+            
+            created_utc = me_data.get("created_utc", 0)
+            created_date = datetime.fromtimestamp(created_utc).date().isoformat() if created_utc else "Unknown"
+            
+            logger.info(f"Profile complete - Posts: {posts_count}, Comments: {comments_count}")
+            
+            profile = UserProfile(
+                username=me_data.get("name", "Unknown"),
+                total_karma=me_data.get("total_karma", 0),
+                link_karma=me_data.get("link_karma", 0),
+                comment_karma=me_data.get("comment_karma", 0),
+                account_created=created_date,
+                total_posts=posts_count,
+                total_comments=comments_count
+            )
+            
+            # A truncated count is still returned, but only complete ones are cached
+            if posts_complete and comments_complete:
+                await cache_profile(session_id, profile)
+            else:
+                logger.warning("Profile counts incomplete, not caching")
+            
+            return profile
         
-    except Exception as e:
-        logger.error(f"Profile fetch error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to fetch profile")
+        except Exception as e:
+            # Task group failures arrive wrapped in an ExceptionGroup
+            errors = e.exceptions if isinstance(e, ExceptionGroup) else [e]
+            logger.error(f"Profile fetch error: {', '.join(str(error) for error in errors)}")
+            raise HTTPException(status_code=500, detail="Failed to fetch profile")
 
 @app.get("/api/posts", response_model=List[Post])
-async def get_user_posts(session_id: str, limit: int = 10):
+async def get_user_posts(request: Request, session_id: str, limit: int = Query(10, ge=1, le=100)):
     """Get user's recent posts"""
-    session = get_session(session_id)
+    session = await get_session(session_id)
     access_token = session["access_token"]
+    client = request.app.state.http
     
     try:
         posts_data = await make_reddit_api_request(
-            access_token, 
-            f"/user/self/submitted?limit={min(limit, 25)}"
+            client,
+            access_token,
+            f"/user/self/submitted?limit={limit}"
         )
         
-        posts = []
-        for post_data in posts_data["data"]["children"]:
-            post = post_data["data"]
-            created_time = datetime.fromtimestamp(post["created_utc"]).strftime('%Y-%m-%d %H:%M:%S')
-            
-            posts.append(Post(
-                title=post.get("title", ""),
-                subreddit=post.get("subreddit", ""),
-                score=post.get("score", 0),
-                num_comments=post.get("num_comments", 0),
-                created_utc=post.get("created_utc", 0),
-                created_time=created_time,
-                permalink=f"https://reddit.com{post.get('permalink', '')}",
-                url=post.get("url", ""),
-                selftext=post.get("selftext", None) if post.get("selftext") else None
-            ))
-        
-        return posts
+        return [build_post(post_data["data"]) for post_data in posts_data["data"]["children"]]
         
     except Exception as e:
         logger.error(f"Posts fetch error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch posts")
 
 @app.get("/api/comments", response_model=List[Comment])
-async def get_user_comments(session_id: str, limit: int = 10):
+async def get_user_comments(request: Request, session_id: str, limit: int = Query(10, ge=1, le=100)):
     """Get user's recent comments"""
-    session = get_session(session_id)
+    session = await get_session(session_id)
     access_token = session["access_token"]
+    client = request.app.state.http
     
     try:
         comments_data = await make_reddit_api_request(
+            client,
             access_token,
-            f"/user/self/comments?limit={min(limit, 25)}"
+            f"/user/self/comments?limit={limit}"
         )
         
-        comments = []
-        for comment_data in comments_data["data"]["children"]:
-            comment = comment_data["data"]
-            created_time = datetime.fromtimestamp(comment["created_utc"]).strftime('%Y-%m-%d %H:%M:%S')
-            
-            comments.append(Comment(
-                subreddit=comment.get("subreddit", ""),
-                post_title=comment.get("link_title", "Unknown Post"),
-                score=comment.get("score", 0),
-                created_utc=comment.get("created_utc", 0),
-                created_time=created_time,
-                body=comment.get("body", ""),
-                permalink=f"https://reddit.com{comment.get('permalink', '')}"
-            ))
-        
-        return comments
+        return [build_comment(comment_data["data"]) for comment_data in comments_data["data"]["children"]]
         
     except Exception as e:
         logger.error(f"Comments fetch error: {str(e)}")
@@ -408,44 +659,23 @@ async def get_user_comments(session_id: str, limit: int = 10):
 @app.delete("/auth/logout")
 async def logout(session_id: str):
     """Logout user by invalidating session"""
-    if session_id in sessions:
-        del sessions[session_id]
+    await delete_session(session_id)
     
     return {"message": "Logged out successfully"}
 
-async def get_all_user_items(access_token: str, endpoint: str, max_items: int = None) -> List[Dict[str, Any]]:
-    """Get all posts or comments for a user by fetching all pages"""
+async def get_all_user_items(client: httpx.AsyncClient, access_token: str, endpoint: str, max_items: int = REDDIT_LISTING_CAP) -> List[Dict[str, Any]]:
+    """Get all posts or comments for a user (capped at Reddit's 1000-item listing limit)"""
     all_items = []
-    after = None
-    limit = 100
     
-    while True:
-        # Build URL with pagination parameters
-        url = f"{endpoint}?limit={limit}"
-        if after:
-            url += f"&after={after}"
-            
-        try:
-            data = await make_reddit_api_request(access_token, url)
-            children = data["data"].get("children", [])
-            
-            if not children:
-                break
-                
+    try:
+        async for children in iter_listing_pages(client, access_token, endpoint):
             # Add items from this batch
             for item in children:
                 all_items.append(item["data"])
                 if max_items and len(all_items) >= max_items:
                     return all_items
-            
-            # Get pagination token for next batch
-            after = data["data"].get("after")
-            if not after:
-                break
-                
-        except Exception as e:
-            logger.error(f"Error fetching page from {endpoint}: {str(e)}")
-            break
+    except Exception as e:
+        logger.error(f"Error fetching page from {endpoint}: {str(e)}")
             
     return all_items
 
@@ -454,4 +684,14 @@ async def get_all_user_items(access_token: str, endpoint: str, max_items: int =
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # More than one worker needs REDIS_URL so sessions are shared between them,
+    # and an import string so uvicorn can load the app in each worker process
+    workers = WEB_CONCURRENCY
+    limit_concurrency = os.getenv("LIMIT_CONCURRENCY")
+    uvicorn.run(
+        "main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None
+    )